@@ -1,26 +1,34 @@
 #!/usr/bin/env python
+import os
+import re
 
 try:
     from setuptools import setup
 except:
     from distutils.core import setup
 
+# read rather than imported, so setup does not need the package's
+# dependencies. Stored results are keyed by it, see yt.finance.store
+with open(os.path.join(os.path.dirname(__file__), 'yt', 'finance', '__init__.py')) as f:
+    version = re.search(r"^__version__ = '([^']+)'", f.read(), re.M).group(1)
+
 setup(name='yt.finance',
-      version='0.2',
+      version=version,
       description='A very basic finance library',
       author='Yusuke Tsutsumi',
       author_email='yusuke@yusuketsutsumi.com',
       url='https://github.com/toumorokoshi/yt.finance',
       packages=['yt', 'yt.finance'],
       requires=['numpy(>=1.7.0)'],
+      python_requires='>=3.7',
       classifiers=[
         'Development Status :: 4 - Beta',
         'Operating System :: MacOS',
         'Operating System :: POSIX :: Linux',
         'Topic :: System :: Software Distribution',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
       ],
       test_suite="tests"
      )
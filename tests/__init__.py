@@ -1,7 +1,12 @@
 import doctest
 import yt.finance.binomial
+import yt.finance.bonds
 import yt.finance.interest
+import yt.finance.lib
 import yt.finance.portfolio
+import yt.finance.service
+import yt.finance.store
+import yt.finance.var
 from yt.finance.binomial import Binomial
 from yt.finance.portfolio import Portfolio
 
@@ -18,7 +23,12 @@ risk_free_return = 0.01
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(module=yt.finance.binomial,
                                         extraglobs={'b': Binomial()}))
+    tests.addTests(doctest.DocTestSuite(module=yt.finance.bonds))
     tests.addTests(doctest.DocTestSuite(module=yt.finance.interest))
+    tests.addTests(doctest.DocTestSuite(module=yt.finance.lib))
     tests.addTests(doctest.DocTestSuite(module=yt.finance.portfolio,
                                         extraglobs={'p': Portfolio(assets, distributions, covariance, risk_free_return)}))
+    tests.addTests(doctest.DocTestSuite(module=yt.finance.service))
+    tests.addTests(doctest.DocTestSuite(module=yt.finance.store))
+    tests.addTests(doctest.DocTestSuite(module=yt.finance.var))
     return tests
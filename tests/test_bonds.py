@@ -1,6 +1,9 @@
 import unittest
 
-from yt.finance.bonds import Bond
+import numpy
+
+from yt.finance import lib
+from yt.finance.bonds import Bond, Book
 
 
 class TestBonds(unittest.TestCase):
@@ -13,3 +16,143 @@ class TestBonds(unittest.TestCase):
         Test the bond price
         """
         self.assertEqual(self.bond.price(precision=2), 77.22)
+
+    def test_bond_price_float32(self):
+        """
+        Test the bond price with float32 lattices against float64
+        """
+        bond = Bond(100, 4, 0.5, 0.06, 1.25, 0.9, dtype=numpy.float32)
+        self.assertEqual(bond.return_lattice[0].dtype, numpy.float32)
+        self.assertEqual(round(float(bond.price()), 2), 77.22)
+        periods = 1000
+        expected = Bond(100, periods, 0.5, 0.0002, 1.001, 0.999, dtype=numpy.float64).price()
+        for compensated in [False, True]:
+            actual = Bond(100, periods, 0.5, 0.0002, 1.001, 0.999,
+                          dtype=numpy.float32, compensated=compensated).price()
+            self.assertTrue(abs(actual - expected) <=
+                            100 * lib.lattice_error_bound(periods, numpy.float32, compensated))
+
+    def test_bond_risk_flat_rates(self):
+        """
+        With flat rates, the risk of a zero coupon bond has a closed form
+        """
+        periods, rate = 10, 0.05
+        risk = Bond(100, periods, 0.5, rate, 1.0, 1.0).risk()
+        self.assertAlmostEqual(risk['price'], 100 / (1 + rate) ** periods)
+        self.assertAlmostEqual(risk['duration'], periods / (1 + rate), places=5)
+        self.assertAlmostEqual(risk['convexity'], periods * (periods + 1) / (1 + rate) ** 2, places=3)
+        for key_rate_duration in risk['key_rate_durations']:
+            self.assertAlmostEqual(key_rate_duration, 1 / (1 + rate), places=5)
+
+    def test_bond_risk_float32(self):
+        """
+        The risk of a float32 bond should match float64, as the shifted
+        scenarios are always priced in float64
+        """
+        expected = Bond(100, 30, 0.5, 0.06, 1.25, 0.9).risk()
+        for compensated in [False, True]:
+            bond = Bond(100, 30, 0.5, 0.06, 1.25, 0.9, dtype=numpy.float32, compensated=compensated)
+            risk = bond.risk()
+            self.assertAlmostEqual(risk['convexity'], expected['convexity'], places=6)
+            self.assertAlmostEqual(risk['duration'], expected['duration'], places=8)
+            self.assertAlmostEqual(bond.convexity(), expected['convexity'], places=6)
+            self.assertAlmostEqual(bond.duration(), expected['duration'], places=8)
+
+    def test_bond_risk(self):
+        """
+        The risk should match pricing bumped lattices one at a time
+        """
+        risk = self.bond.risk(shift=0.001)
+        self.assertAlmostEqual(risk['price'], self.bond.price())
+        self.assertEqual(len(risk['key_rate_durations']), 4)
+        self.assertAlmostEqual(sum(risk['key_rate_durations']), risk['duration'], places=4)
+        for period in range(4):
+            prices = []
+            for shift in [0.001, -0.001]:
+                discounts = [[1 / (1 + r + (shift if i == period else 0)) for r in column]
+                             for i, column in enumerate(self.bond.return_lattice[:4])]
+                prices.append(lib.roll_back([100] * 5, discounts, 0.5)[0][0])
+            self.assertAlmostEqual(risk['key_rate_durations'][period],
+                                   (prices[1] - prices[0]) / (0.002 * risk['price']), places=5)
+
+
+class TestBook(unittest.TestCase):
+
+    def setUp(self):
+        self.periods = 10
+        self.rates = lib.generate_lattice(self.periods, 0.05, 1.1, 0.9)
+        self.book = Book(self.periods)
+
+    def test_empty(self):
+        """
+        An empty book should price to an empty array
+        """
+        self.assertEqual(self.book.price(self.rates, 0.5).shape, (0,))
+        self.assertEqual(self.book.matrices()['cash_flows'].shape, (self.periods + 1, 0))
+
+    def test_coupon_option(self):
+        """
+        An option on a coupon bond should be on the bond ex-coupon, and
+        at maturity on the face value alone
+        """
+        book = Book(4)
+        bond = book.add_bond(100, 4, coupon=0.05)
+        at_coupon = book.add_option(bond, 0, 2)
+        at_maturity = book.add_option(bond, 0, 4)
+        prices = book.price([[0.05] * (i + 1) for i in range(4)], 0.5)
+        self.assertAlmostEqual(prices[at_coupon], 100 / 1.05 ** 2)
+        self.assertAlmostEqual(prices[at_maturity], 100 / 1.05 ** 4)
+
+    def test_bonds(self):
+        """
+        Bonds in a book should be priced as they are alone
+        """
+        bonds = [self.book.add_bond(100, maturity) for maturity in range(1, self.periods + 1)]
+        prices = self.book.price(self.rates, 0.5)
+        for maturity, bond in zip(range(1, self.periods + 1), bonds):
+            self.assertAlmostEqual(prices[bond], Bond(100, maturity, 0.5, 0.05, 1.1, 0.9).price())
+
+    def test_coupon_bond(self):
+        """
+        A coupon bond is a portfolio of zero coupon bonds
+        """
+        coupon_bond = self.book.add_bond(100, 4, coupon=0.05)
+        zeros = [self.book.add_bond(1, maturity) for maturity in range(1, 5)]
+        prices = self.book.price(self.rates, 0.5)
+        self.assertAlmostEqual(prices[coupon_bond], 5 * prices[zeros].sum() + 100 * prices[zeros[-1]])
+
+    def test_cap_floor_parity(self):
+        """
+        A cap less a floor is a payer swap, settled in arrears
+        """
+        cap = self.book.add_cap(100, 0.05, 8, start=2)
+        floor = self.book.add_floor(100, 0.05, 8, start=2)
+        zeros = [self.book.add_bond(1, maturity) for maturity in range(1, 9)]
+        prices = self.book.price(self.rates, 0.5)
+        swap = 100 * (prices[zeros[1]] - prices[zeros[7]]) - 100 * 0.05 * prices[zeros[2:]].sum()
+        self.assertTrue(prices[cap] > 0 and prices[floor] > 0)
+        self.assertAlmostEqual(prices[cap] - prices[floor], swap)
+
+    def test_american_put(self):
+        """
+        An american put in a book should match pricing the put alone
+        """
+        bond = Bond(100, self.periods, 0.5, 0.05, 1.1, 0.9)
+        put = bond.price_american_put(6, 80)
+        bond_lattice = bond.price_lattice()
+        expected = lib.roll_back([max(0, 80 - x) for x in bond_lattice[6][:7]],
+                                 [[1 / (1 + r) for r in column] for column in bond.return_lattice[:6]],
+                                 0.5, exercise=[[80 - x for x in column] for column in bond_lattice[:6]])
+        self.assertAlmostEqual(put, expected[0][0])
+
+    def test_european_call(self):
+        """
+        A european call in a book should match pricing the call alone
+        """
+        bond = Bond(100, self.periods, 0.5, 0.05, 1.1, 0.9)
+        call = self.book.add_option(self.book.add_bond(100, self.periods), 84, 6)
+        expected = lib.roll_back([max(0, x - 84) for x in bond.price_lattice()[6][:7]],
+                                 [[1 / (1 + r) for r in column] for column in bond.return_lattice[:6]],
+                                 0.5)
+        self.assertTrue(expected[0][0] > 0)
+        self.assertAlmostEqual(self.book.price(self.rates, 0.5)[call], expected[0][0])
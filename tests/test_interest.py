@@ -0,0 +1,51 @@
+import unittest
+
+from yt.finance import interest
+from yt.finance.interest import Curve
+
+
+class TestCurve(unittest.TestCase):
+
+    def setUp(self):
+        self.spot_rates = [0.03 + 0.001 * i for i in range(30)]
+        self.swap_rates = [interest.swap(i + 1, self.spot_rates) for i in range(30)]
+
+    def test_bootstrap(self):
+        """ bootstrapping the fair swap rates should recover the spot rates """
+        for expected, actual in zip(self.spot_rates, interest.bootstrap(self.swap_rates)):
+            self.assertAlmostEqual(expected, actual)
+
+    def test_mixed_quotes(self):
+        """ deposits and forwards should bootstrap alongside swaps """
+        curve = Curve(30)
+        curve.deposit(1, self.spot_rates[0])
+        curve.deposit(2, self.spot_rates[1])
+        curve.forward(2, 3, interest.rate(2, 3, self.spot_rates))
+        for i in range(3, 30):
+            curve.swap(i + 1, self.swap_rates[i])
+        for expected, actual in zip(self.spot_rates, curve.spot_rates()):
+            self.assertAlmostEqual(expected, actual)
+
+    def test_warm_start(self):
+        """ changing a quote should only solve the periods from it on """
+        curve = Curve(30)
+        for i in range(30):
+            curve.swap(i + 1, self.swap_rates[i])
+        before = curve.discount_factors()
+        curve.discounts[:20] = [None] * 20  # these must not be solved again
+        curve.swap(21, self.swap_rates[20] + 0.001)
+        curve.swap(25, self.swap_rates[24])
+        after = curve.bootstrap().discounts
+        self.assertEqual(after[:20], [None] * 20)
+        self.assertTrue(after[20] < before[20])
+        self.assertTrue(all(a != b for a, b in zip(after[20:], before[20:])))
+
+    def test_missing_quote(self):
+        curve = Curve(3)
+        curve.swap(1, 0.03)
+        curve.swap(3, 0.03)
+        self.assertRaises(AssertionError, curve.bootstrap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 
+import numpy
+
 from yt.finance import lib
-from yt.finance.lib import precision, generate_lattice
+from yt.finance.lib import precision, generate_lattice, roll_back
 
 
 class TestLibrary(unittest.TestCase):
@@ -24,5 +26,45 @@ class TestLibrary(unittest.TestCase):
                                    [0.15, 0.11, 0.08, 0.05, 0.04],
                                    [0.18, 0.13, 0.09, 0.07, 0.05, 0.04]], "Lattice was not as expected!")
 
+    def test_lattice_dtype(self):
+        lattice = generate_lattice(5, 0.06, 1.25, 0.9, dtype=numpy.float32)
+        self.assertEqual(lattice[5].dtype, numpy.float32)
+        self.assertEqual(generate_lattice(5, 0.06, 1.25, 0.9, dtype=numpy.float64, precision=2)[5].tolist(),
+                         [0.18, 0.13, 0.09, 0.07, 0.05, 0.04])
+
+    def test_roll_back_matches_lists(self):
+        """ roll_back in float64 should match the list based lattice """
+        rates = generate_lattice(4, 0.06, 1.25, 0.9)
+        discounts = [[1 / (1 + r) for r in column] for column in rates[:4]]
+        values = roll_back([100] * 5, discounts, 0.5)
+        self.assertEqual(round(values[0][0], 2), 77.22)
+
+    def test_roll_back_decrement(self):
+        """ discounting by 1 - discount in dtype should match discounting by discount """
+        rates = generate_lattice(4, 0.06, 1.25, 0.9, dtype=numpy.float32)
+        expected = roll_back([100] * 5, [1 / (1 + c.astype(numpy.float64)) for c in rates[:4]], 0.5,
+                             dtype=numpy.float32, full_lattice=False)
+        actual = roll_back([100] * 5, None, 0.5, dtype=numpy.float32, full_lattice=False,
+                           decrement=[c / (1 + c) for c in rates[:4]])
+        self.assertEqual(actual.dtype, numpy.float32)
+        self.assertAlmostEqual(float(actual[0]), float(expected[0]), places=4)
+
+    def test_roll_back_float32_error_bound(self):
+        """ float32 lattices should be within the documented bound of float64 """
+        periods = 2000
+        rates = generate_lattice(periods, 0.0001, 1.002, 0.998)
+        discounts = [[1 / (1 + r) for r in column] for column in rates[:periods]]
+        terminal = numpy.linspace(0, 150, periods + 1)
+        exercise = [numpy.linspace(0, 140, i + 1) for i in range(periods)]
+        expected = roll_back(terminal, discounts, 0.45, exercise=exercise)
+        for compensated in [False, True]:
+            actual = roll_back(terminal, discounts, 0.45, exercise=exercise,
+                               dtype=numpy.float32, compensated=compensated)
+            self.assertEqual(actual[0].dtype, numpy.float32)
+            bound = lib.lattice_error_bound(periods, numpy.float32, compensated=compensated)
+            for i in [0, periods // 2, periods]:
+                self.assertTrue(numpy.all(numpy.abs(actual[i] - expected[i]) <= bound * 150))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from yt.finance.portfolio import Portfolio
+
+
+class TestConstrainedOptimization(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        factors = random.normal(size=(50, 3)) * 0.1
+        self.covariance = factors.dot(factors.T) + np.diag(random.uniform(0.01, 0.05, 50))
+        self.assets = random.uniform(0, 0.1, 50)
+        self.portfolio = Portfolio(self.assets, np.ones(50) / 50, self.covariance)
+
+    def test_matches_unconstrained(self):
+        """ with loose enough bounds, the result should match minimize_variance """
+        expected = self.portfolio.minimize_variance(0.08)
+        actual = self.portfolio.minimize_variance_constrained(0.08, lower=-10, upper=10)
+        np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+    def test_constraints(self):
+        weights = np.array(self.portfolio.minimize_variance_constrained(
+            0.06, upper=0.1, groups=[(range(10), 0.3, 0.5)]))
+        self.assertTrue(weights.min() >= 0)
+        self.assertTrue(weights.max() <= 0.1 + 1e-9)
+        self.assertAlmostEqual(weights.sum(), 1, places=5)
+        self.assertTrue(self.assets.dot(weights) >= 0.06 - 1e-6)
+        self.assertTrue(0.3 - 1e-6 <= weights[:10].sum() <= 0.5 + 1e-6)
+
+    def test_turnover(self):
+        previous = np.ones(50) / 50
+        weights = np.array(self.portfolio.minimize_variance_constrained(turnover=0.2))
+        self.assertTrue(np.abs(weights - previous).sum() <= 0.2 + 1e-9)
+        unlimited = np.array(self.portfolio.minimize_variance_constrained())
+        self.assertTrue(np.abs(unlimited - previous).sum() > 0.2)
+
+    def test_warm_start(self):
+        """ re-solving with a slightly changed target should take fewer iterations """
+        self.portfolio.minimize_variance_constrained(0.06, upper=0.1)
+        cold = self.portfolio.iterations
+        self.portfolio.minimize_variance_constrained(0.0601, upper=0.1)
+        self.assertTrue(self.portfolio.iterations < cold)
+
+    def test_infeasible_return(self):
+        """ a return above every asset's should raise, not return a violating distribution """
+        with self.assertRaises(ValueError):
+            self.portfolio.minimize_variance_constrained(0.2)
+        # and should not spoil the next solve
+        weights = np.array(self.portfolio.minimize_variance_constrained(0.06))
+        self.assertTrue(self.assets.dot(weights) >= 0.06 - 1e-6)
+
+    def test_infeasible_bounds(self):
+        """ upper bounds summing to less than one should raise """
+        portfolio = Portfolio([0.1, 0.06, 0.02], [0, 0, 0], [[0.04, 0, 0], [0, 0.01, 0], [0, 0, 0.0025]])
+        with self.assertRaises(ValueError):
+            portfolio.minimize_variance_constrained(upper=0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import unittest
+
+from yt.finance.binomial import Binomial
+from yt.finance.service import LocalClient, PricerBackend, PricingService
+
+
+class RecordingBackend(PricerBackend):
+    """ A PricerBackend that records the batches it's handed """
+
+    def __init__(self, pricer):
+        super(RecordingBackend, self).__init__(pricer)
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, requests):
+        self.release.wait()
+        self.batches.append(requests)
+        return super(RecordingBackend, self).__call__(requests)
+
+
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = RecordingBackend(Binomial())
+
+    def run_with_service(self, test, **kwargs):
+
+        async def run():
+            async with PricingService(self.backend, **kwargs) as service:
+                try:
+                    return await test(service, LocalClient(service))
+                finally:
+                    # never leave the backend blocked, or the executor hangs
+                    if isinstance(self.backend, RecordingBackend):
+                        self.backend.release.set()
+        return asyncio.run(run())
+
+    def test_coalesce(self):
+        """ identical concurrent requests should be priced once """
+
+        async def test(service, client):
+            lattice = Binomial().generate_stock_lattice(3, 100, 1.07)
+            results = await asyncio.gather(*[
+                client.price_call(3, 100, 1.01, 1.07, lattice, precision=2) for i in range(10)])
+            return service, results
+
+        service, results = self.run_with_service(test)
+        self.assertEqual(results, [[[6.57], [10.23, 2.13], [15.48, 3.86, 0.0], [22.5, 7.0, 0, 0]]] * 10)
+        self.assertEqual(service.coalesced, 9)
+        self.assertEqual(sum(len(b) for b in self.backend.batches), 1)
+        # each requester gets it's own lattice to modify
+        results[0].insert(0, [])
+        self.assertEqual(len(results[1]), 4)
+
+    def test_micro_batch(self):
+        """ distinct concurrent requests should be batched up to max_batch_size """
+
+        async def test(service, client):
+            return await asyncio.gather(*[
+                client.convert_black_sholes_params(15 + i, 0.25, 0.02, 110, 0.3, 0.01) for i in range(10)])
+
+        results = self.run_with_service(test, max_batch_size=4, max_wait=1)
+        self.assertEqual(len(results), 10)
+        self.assertEqual([len(b) for b in self.backend.batches], [4, 4, 2])
+
+    def test_errors(self):
+        """ a failing request should not fail the rest of it's batch """
+
+        async def test(service, client):
+            return await asyncio.gather(client.no_such_method(),
+                                        client.generate_stock_lattice(1, 100, 1.07, precision=2),
+                                        return_exceptions=True)
+
+        error, result = self.run_with_service(test)
+        self.assertTrue(isinstance(error, AttributeError))
+        self.assertEqual(result, [[100.0], [107.0, 93.46]])
+
+    def test_deadline(self):
+        """ requests should time out, and expired requests should not be priced """
+        self.backend.release.clear()
+
+        async def test(service, client):
+            first = asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.07, precision=2))
+            await asyncio.sleep(0.05)
+            # the first batch is stuck in the backend, so these queue behind it
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.generate_stock_lattice(1, 100, 1.08, timeout=0.01)
+            self.backend.release.set()
+            return await first
+
+        self.assertEqual(self.run_with_service(test, max_wait=0), [[100.0], [107.0, 93.46]])
+        self.assertEqual([len(b) for b in self.backend.batches], [1])
+
+    def test_backpressure(self):
+        """ submitters should wait once max_pending requests are queued """
+        self.backend.release.clear()
+
+        async def test(service, client):
+            tasks = [asyncio.ensure_future(client.convert_black_sholes_params(15 + i, 0.25, 0.02, 110, 0.3, 0.01))
+                     for i in range(5)]
+            await asyncio.sleep(0.05)
+            # one request is in the backend, and the queue holds two more
+            self.assertEqual(service._queue.qsize(), 2)
+            self.backend.release.set()
+            return await asyncio.gather(*tasks)
+
+        results = self.run_with_service(test, max_batch_size=1, max_wait=0, max_pending=2)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(self.backend.batches), 5)
+
+    def test_cancelled_while_queueing(self):
+        """ a request cancelled before it is queued should not be left in flight """
+        self.backend.release.clear()
+
+        async def test(service, client):
+            queued = [asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.01 + i / 100.0))
+                      for i in range(3)]
+            await asyncio.sleep(0.05)
+            # one is in the backend, one waits for a batch slot, and one fills the queue
+            blocked = asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.09))
+            await asyncio.sleep(0.05)
+            blocked.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(len(service._in_flight), 3)
+            self.backend.release.set()
+            await asyncio.gather(*queued)
+            return await asyncio.wait_for(client.generate_stock_lattice(1, 100, 1.09, precision=2), 1)
+
+        self.assertEqual(self.run_with_service(test, max_batch_size=1, max_wait=0, max_pending=1),
+                         [[100.0], [109.0, 91.74]])
+
+    def test_timeout_while_queueing(self):
+        """ a request's timeout should include waiting for room in the queue """
+        self.backend.release.clear()
+
+        async def test(service, client):
+            queued = [asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.01 + i / 100.0))
+                      for i in range(3)]
+            await asyncio.sleep(0.05)
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.generate_stock_lattice(1, 100, 1.09, timeout=0.05)
+            self.assertEqual(len(service._in_flight), 3)
+            self.backend.release.set()
+            return await asyncio.gather(*queued)
+
+        self.assertEqual(len(self.run_with_service(test, max_batch_size=1, max_wait=0, max_pending=1)), 3)
+        self.assertEqual(len(self.backend.batches), 3)
+
+    def test_duplicate_outlives_timeout(self):
+        """ a request timing out before it is queued should not cancel it's duplicates """
+        self.backend.release.clear()
+
+        async def test(service, client):
+            queued = [asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.01 + i / 100.0))
+                      for i in range(3)]
+            await asyncio.sleep(0.05)
+            # the first submitter, which times out waiting for the queue
+            first = asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.09, precision=2, timeout=0.05))
+            await asyncio.sleep(0)
+            duplicate = asyncio.ensure_future(client.generate_stock_lattice(1, 100, 1.09, precision=2))
+            with self.assertRaises(asyncio.TimeoutError):
+                await first
+            self.backend.release.set()
+            await asyncio.gather(*queued)
+            return await asyncio.wait_for(duplicate, 1)
+
+        self.assertEqual(self.run_with_service(test, max_batch_size=1, max_wait=0, max_pending=1),
+                         [[100.0], [109.0, 91.74]])
+        self.assertEqual(len(self.backend.batches), 4)
+
+    def test_short_results(self):
+        """ a backend returning too few results should fail the batch """
+
+        async def test(service, client):
+            return await asyncio.gather(*[client.generate_stock_lattice(i, 100, 1.07) for i in range(3)],
+                                        return_exceptions=True)
+
+        self.backend = lambda requests: [None]
+        results = self.run_with_service(test, max_wait=1)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from yt.finance.binomial import Binomial
+from yt.finance.bonds import Bond
+from yt.finance.portfolio import Portfolio
+from yt.finance.service import PricerBackend, PricingRequest
+from yt.finance.store import CachedBackend, ResultStore, pricer_state
+
+
+def write_results(path, worker):
+    store = ResultStore(path)
+    for i in range(25):
+        store.put_many(dict((store.key('worker', worker, i, j), (worker, i, j)) for j in range(4)))
+    store.close()
+
+
+class CountingBackend(PricerBackend):
+
+    def __init__(self, pricer):
+        super(CountingBackend, self).__init__(pricer)
+        self.priced = 0
+
+    def __call__(self, requests):
+        self.priced += len(requests)
+        return super(CountingBackend, self).__call__(requests)
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'results.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_persistence(self):
+        """ results should outlive the store that wrote them """
+        store = ResultStore(self.path)
+        keys = [store.key('binomial', i) for i in range(1000)]
+        store.put_many(dict((key, i) for i, key in enumerate(keys)))
+        store.close()
+        store = ResultStore(self.path)
+        self.assertEqual(store.get_many(keys + ['missing']), dict((key, i) for i, key in enumerate(keys)))
+        self.assertEqual(store.get('missing', 'default'), 'default')
+        self.assertEqual(ResultStore(self.path, version='0').get_many(
+            [ResultStore(self.path, version='0').key('binomial', 1)]), {})
+
+    def test_ttl(self):
+        store = ResultStore(self.path, ttl=0.1)
+        store.put('a', 1)
+        self.assertEqual(store.get('a'), 1)
+        time.sleep(0.15)
+        self.assertEqual(store.get('a'), None)
+        store.evict()
+        self.assertEqual(len(store), 0)
+
+    def test_size_eviction(self):
+        """ the least recently used results should be evicted first """
+        store = ResultStore(self.path, max_bytes=3500)
+        store.put('a', b'x' * 1000)
+        store.put('b', b'x' * 1000)
+        store.put('c', b'x' * 1000)
+        time.sleep(0.01)
+        store.get('a')
+        store.put('d', b'x' * 1000)
+        self.assertEqual(sorted(store.get_many(['a', 'b', 'c', 'd'])), ['a', 'c', 'd'])
+
+    def test_concurrent_processes(self):
+        processes = [multiprocessing.Process(target=write_results, args=(self.path, worker))
+                     for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(len(ResultStore(self.path)), 400)
+
+    def test_cached_backend(self):
+        """ a restarted backend should only price what was not stored """
+        requests = [PricingRequest('generate_stock_lattice', (i, 100, 1.07), {}) for i in range(5)]
+        backend = CountingBackend(Binomial())
+        first = CachedBackend(backend, ResultStore(self.path), 'Binomial')(requests[:3])
+        backend = CountingBackend(Binomial())
+        second = CachedBackend(backend, ResultStore(self.path), 'Binomial')(requests)
+        self.assertEqual(backend.priced, 2)
+        self.assertEqual(second[:3], first)
+        self.assertEqual(second[4], Binomial().generate_stock_lattice(4, 100, 1.07))
+
+    def test_cached_state(self):
+        """ methods of pricers with different state should not share results """
+        store = ResultStore(self.path)
+        first, second = Bond(100, 4, 0.5, 0.06, 1.25, 0.9), Bond(100, 4, 0.5, 0.08, 1.25, 0.9)
+        self.assertEqual(round(store.cached(first.price, 'Bond.price')(), 2), 77.22)
+        self.assertEqual(round(store.cached(second.price, 'Bond.price')(), 2), 71.13)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(round(store.cached(Bond(100, 4, 0.5, 0.06, 1.25, 0.9).price, 'Bond.price')(), 2), 77.22)
+        self.assertEqual(len(store), 2)
+
+    def test_cached_repeat(self):
+        """ a repeated call should hit the store, though the pricer keeps scratch state """
+        store = ResultStore(self.path)
+        portfolio = Portfolio([0.1, 0.06, 0.02], [0, 0, 0], [[0.04, 0, 0], [0, 0.01, 0], [0, 0, 0.0025]])
+        minimize = store.cached(portfolio.minimize_variance_constrained)
+        first = minimize(0.05)
+        portfolio.iterations = 0
+        self.assertEqual(minimize(0.05), first)
+        self.assertEqual(portfolio.iterations, 0)
+        self.assertEqual(len(store), 1)
+
+    def test_cached_backend_state(self):
+        """ backends of pricers with different state should not share results """
+        store = ResultStore(self.path)
+        requests = [PricingRequest('price', (), {})]
+        first = CachedBackend(PricerBackend(Bond(100, 4, 0.5, 0.06, 1.25, 0.9)), store, 'Bond')(requests)
+        second = CachedBackend(PricerBackend(Bond(100, 4, 0.5, 0.08, 1.25, 0.9)), store, 'Bond')(requests)
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(store), 2)
+
+    def test_cached_backend_unfreezable(self):
+        """ a request which can't be keyed should be priced, without failing the rest of it's batch """
+        store = ResultStore(self.path)
+        requests = [PricingRequest('generate_stock_lattice', (1, 100, 1.07), {}),
+                    PricingRequest('generate_stock_lattice', (1, object(), 1.07), {})]
+        results = CachedBackend(PricerBackend(Binomial()), store, 'Binomial')(requests)
+        self.assertEqual(results[0], Binomial().generate_stock_lattice(1, 100, 1.07))
+        self.assertTrue(isinstance(results[1], TypeError))
+        self.assertEqual(len(store), 1)
+
+    def test_unfreezable(self):
+        """ inputs which can only be identified by their repr should raise """
+        store = ResultStore(self.path)
+        with self.assertRaises(TypeError):
+            store.key('price', object())
+        with self.assertRaises(TypeError):
+            pricer_state(PricerBackend(Binomial()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from yt.finance.portfolio import Portfolio
+from yt.finance.var import HistoricalSimulation
+
+
+class TestHistoricalSimulation(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.returns = random.normal(0, 0.01, size=(2520, 20))
+        self.weights = random.dirichlet(np.ones(20), size=5)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'returns.npy')
+        np.save(self.path, self.returns)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def expected(self, weights, confidence):
+        losses = np.sort(-self.returns.dot(weights))[::-1]
+        tail = int(np.ceil(round((1 - confidence) * len(losses), 9)))
+        return losses[tail - 1], losses[:tail].mean()
+
+    def test_memory_mapped(self):
+        """ a memory mapped history should match a full sort, for any block size """
+        for block_size in [1, 100, 5000]:
+            simulation = HistoricalSimulation(self.path, block_size=block_size)
+            self.assertTrue(isinstance(simulation.returns, np.memmap))
+            value_at_risk, expected_shortfall = simulation.risk(self.weights, 0.99)
+            for i, weights in enumerate(self.weights):
+                expected = self.expected(weights, 0.99)
+                self.assertAlmostEqual(value_at_risk[i], expected[0])
+                self.assertAlmostEqual(expected_shortfall[i], expected[1])
+
+    def test_portfolio(self):
+        portfolio = Portfolio(np.zeros(20), self.weights[0], np.eye(20))
+        expected = self.expected(self.weights[0], 0.95)
+        self.assertAlmostEqual(portfolio.value_at_risk(self.path, 0.95), expected[0])
+        self.assertAlmostEqual(portfolio.expected_shortfall(self.returns, 0.95), expected[1])
+        self.assertTrue(expected[1] > expected[0] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -72,6 +72,108 @@ def rate(start, stop, rates):
         return (((1 + rates[stop - 1]) ** stop) /
                 ((1 + rates[start - 1]) ** start)) ** power - 1
 
+
+@precision
+def bootstrap(swap_rates):
+    """
+    Calculate the spot rates for each period, from the fair swap rates
+    of swaps over 1 to n periods. This is the inverse of swap.
+
+    >>> bootstrap([swap(i + 1, [0.07, 0.073, 0.077]) for i in range(3)], precision=3)
+    [0.07, 0.073, 0.077]
+    """
+    curve = Curve(len(swap_rates))
+    for i, swap_rate in enumerate(swap_rates):
+        curve.swap(i + 1, swap_rate)
+    return curve.spot_rates()
+
+
+class Curve(object):
+    """
+    A discount curve over periods periods, bootstrapped from market
+    quotes: deposits, forward rates and par swap rates. Each period
+    must be the end of exactly one quote.
+
+    The discount factor of each period is solved from the ones before
+    it, using a running sum of the discount factors (the annuity) for
+    swaps, so a whole curve takes O(n). After a quote changes, only the
+    periods from the changed quote on are solved again.
+
+    >>> curve = Curve(3)
+    >>> curve.deposit(1, 0.07)
+    >>> curve.forward(1, 2, 0.076)
+    >>> curve.swap(3, 0.0766)
+    >>> curve.spot_rates(precision=3)
+    [0.07, 0.073, 0.077]
+    """
+    periods = 0  # the number of periods of the curve
+    quotes = None  # the quote ending at each period, as a tuple of (kind, rate, start)
+    discounts = None  # the discount factor of each period
+    annuities = None  # the sum of the discount factors, up to and including each period
+
+    def __init__(self, periods):
+        self.periods = periods
+        self.quotes = [None] * periods
+        self.discounts = [None] * periods
+        self.annuities = [None] * periods
+        self.__solved = 0  # the number of periods with an up to date discount factor
+
+    def deposit(self, period, rate):
+        """ Quote the spot rate for period periods """
+        self.__quote(period, ('deposit', rate, 0))
+
+    def forward(self, start, stop, rate):
+        """ Quote the forward rate per period, from start to stop """
+        assert 0 <= start < stop, "A forward must start before it stops!"
+        self.__quote(stop, ('forward', rate, start))
+
+    def swap(self, period, rate):
+        """ Quote the fair swap rate of a swap over period periods """
+        self.__quote(period, ('swap', rate, 0))
+
+    def bootstrap(self):
+        """
+        Solve the discount factors of every period which is not up to
+        date, and return the curve.
+        """
+        for i in range(self.__solved, self.periods):
+            assert self.quotes[i] is not None, "No quote ends in period %s!" % (i + 1)
+            kind, quote, start = self.quotes[i]
+            period = i + 1
+            annuity = self.annuities[i - 1] if i > 0 else 0
+            if kind == 'deposit':
+                discount = 1 / ((1 + quote) ** period)
+            elif kind == 'forward':
+                start_discount = self.discounts[start - 1] if start > 0 else 1
+                discount = start_discount / ((1 + quote) ** (period - start))
+            else:
+                # a par swap is worth nothing: 1 = rate * annuity + discount
+                discount = (1 - quote * annuity) / (1 + quote)
+            self.discounts[i] = discount
+            self.annuities[i] = annuity + discount
+        self.__solved = self.periods
+        return self
+
+    @precision
+    def discount_factors(self):
+        """ Returns the discount factor of each period """
+        return list(self.bootstrap().discounts)
+
+    @precision
+    def spot_rates(self):
+        """
+        Returns the spot rate of each period, in the form expected by
+        the rates of swap and rate.
+        """
+        return [d ** (-1.0 / (i + 1)) - 1 for i, d in enumerate(self.bootstrap().discounts)]
+
+    def __quote(self, period, quote):
+        assert 0 < period <= self.periods, "period must be within the curve!"
+        if self.quotes[period - 1] != quote:
+            self.quotes[period - 1] = quote
+            self.__solved = min(self.__solved, period - 1)
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -2,6 +2,7 @@
 lib.py: a set of utility methods for yt.finance
 """
 import functools
+import numpy
 from numpy import float64
 
 __author__ = 'yusuke tsutsumi'
@@ -38,9 +39,14 @@ def recursive_round(value, precision):
     {'a': 1.0, 'b': 'c'}
     >>> recursive_round(1.070980, 2)
     1.07
+    >>> recursive_round(-0.0001, 2)
+    0.0
     """
-    if type(value) in [float, float64]:
-        return round(value, precision)
+    if type(value) in [float, float64] or isinstance(value, numpy.floating):
+        # adding zero turns a -0.0 into 0.0
+        return round(value, precision) + 0.0
+    elif isinstance(value, numpy.ndarray):
+        return numpy.round(value, precision)
     elif type(value) == list:
         return [recursive_round(v, precision) for v in value]
     elif type(value) == dict:
@@ -49,17 +55,70 @@ def recursive_round(value, precision):
         return value
 
 
+def freeze(value, strict=False):
+    """
+    Convert an arbitrary python object of pricing inputs (lists, dicts,
+    numpy arrays and scalars) into a hashable, canonical equivalent, so
+    identical inputs compare equal regardless of their container types.
+
+    Other objects are returned as they are, unless strict, when a
+    TypeError is raised instead: their repr may hold a memory address,
+    so it can't identify them outside the process.
+
+    >>> freeze({'b': [1, 2.5], 'a': (3,)})
+    (('a', (3,)), ('b', (1, 2.5)))
+    >>> freeze([object()], strict=True)
+    Traceback (most recent call last):
+        ...
+    TypeError: Cannot freeze an object of type object!
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v, strict) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, freeze(v, strict)) for k, v in value.items()))
+    elif isinstance(value, numpy.ndarray):
+        if strict and value.dtype.hasobject:
+            raise TypeError("Cannot freeze an array of objects!")
+        return (value.dtype.str, value.shape, value.tobytes())
+    elif isinstance(value, numpy.generic):
+        return value.item()
+    elif isinstance(value, numpy.dtype):
+        return value.str
+    elif isinstance(value, type):
+        return value.__module__ + '.' + value.__name__
+    elif strict and not (value is None or isinstance(value, (bool, int, float, complex, str, bytes))):
+        raise TypeError("Cannot freeze an object of type %s!" % type(value).__name__)
+    return value
+
+
 def __calculate_lattice_value(initial_value, variance_up, variance_down,
                               positive_changes, negative_changes):
     return initial_value * (variance_up ** positive_changes) * \
         ((1.0 * variance_down) ** negative_changes)
 
 
+def __generate_lattice_column(column, initial_value, variance_up,
+                              variance_down, dtype):
+    # powers are taken in float64 and rounded once, since rounding
+    # variance_up to dtype first would compound it's error with every change
+    negative_changes = numpy.arange(column + 1)
+    return (initial_value *
+            (float64(variance_up) ** (column - negative_changes)) *
+            (float64(variance_down) ** negative_changes)).astype(dtype)
+
+
 @precision
-def generate_lattice(periods, initial_value, variance_up, variance_down):
+def generate_lattice(periods, initial_value, variance_up, variance_down, dtype=None):
     """
     Generate a lattice
+
+    if dtype is provided (e.g. numpy.float32), each column is computed
+    and returned as a numpy array of that dtype instead of a list.
     """
+    if dtype is not None:
+        return [__generate_lattice_column(i, initial_value, variance_up,
+                                          variance_down, dtype)
+                for i in range(periods + 1)]
     return_values = []
     for i in range(periods + 1):
         return_column = []
@@ -99,3 +158,162 @@ def price_lattice(periods, lattice, initial_values, method):
         return_lattice.insert(0, column)
     column.append(value)
     return return_lattice
+
+
+
+def lattice_error_bound(periods, dtype, compensated=False):
+    """
+    Returns the documented bound on the absolute error of roll_back over
+    periods periods in dtype, relative to the largest magnitude found in
+    the terminal and exercise values. This assumes the up probability is
+    within [0, 1] and the discount factors are within [0, 1], which
+    holds for any arbitrage-free lattice with non-negative rates.
+
+    Without compensation every period rounds a handful of arithmetic
+    operations, so the error grows linearly with the periods. With
+    compensation those roundings are carried forward in a second term
+    and only second order errors accumulate.
+
+    >>> lattice_error_bound(1000, numpy.float32) < 1e-3
+    True
+    >>> lattice_error_bound(1000, numpy.float32, compensated=True) < 1e-6
+    True
+    """
+    eps = float(numpy.finfo(dtype).eps)
+    if compensated:
+        return 4 * eps + 16 * periods * eps ** 2
+    return (4 * periods + 4) * eps
+
+
+def __split_float(values, dtype):
+    """
+    Split values into a (high, low) pair of dtype, where high + low
+    represents values to roughly twice the precision of dtype.
+    """
+    values = numpy.asarray(values, dtype=float64)
+    high = values.astype(dtype)
+    return high, (values - high).astype(dtype)
+
+
+def __veltkamp_split(value, splitter):
+    scaled = splitter * value
+    high = scaled - (scaled - value)
+    return high, value - high
+
+
+def __two_product(a, b, splitter):
+    """
+    Dekker's error free product: returns (p, e) with a * b == p + e exactly.
+    """
+    product = a * b
+    a_high, a_low = __veltkamp_split(a, splitter)
+    b_high, b_low = __veltkamp_split(b, splitter)
+    error = ((a_high * b_high - product) + a_high * b_low + a_low * b_high) + a_low * b_low
+    return product, error
+
+
+def __two_sum(a, b):
+    """
+    Knuth's error free sum: returns (s, e) with a + b == s + e exactly.
+    """
+    total = a + b
+    b_virtual = total - a
+    error = (a - (total - b_virtual)) + (b - b_virtual)
+    return total, error
+
+
+def roll_back(terminal_values, discount, up_probability, exercise=None,
+              dtype=float64, compensated=False, full_lattice=True, adjust=None,
+              decrement=None):
+    """
+    Vectorized backward induction over a recombining lattice, where the
+    value of a node is:
+
+    discount * (up_probability * up_value + (1 - up_probability) * down_value)
+
+    * terminal_values: the values of the last column of the lattice.
+      Any further axes are carried through as independent scenarios
+      (e.g. bumped inputs), priced in the same sweep.
+    * discount: the discount factor of a period, either a single value
+      or a lattice with a column of discount factors per period. Each
+      column must broadcast against the values of it's column.
+    * up_probability: the risk neutral probability of an up move
+    * exercise: an optional lattice of early exercise values. A node is
+      worth the greater of it's continuation and exercise value.
+    * dtype: the numpy dtype to carry the lattice in
+    * compensated: track the rounding error of every period in a second
+      term, Kahan style, and carry the discount factors and probabilities
+      at twice the precision of dtype. This is several times the work
+      per node, and is only worth it for long lattices in a reduced
+      precision dtype.
+    * full_lattice: if False, only the root column is returned, and the
+      rest of the lattice is not kept in memory.
+    * adjust: an optional method which takes the column number and
+      the values of the column (including the terminal values), and
+      returns them adjusted, e.g. for cash flows or early exercise.
+    * decrement: optionally, 1 - discount in place of discount, in the
+      same form. Columns already in dtype are used as they are, so a
+      caller holding rates in dtype never builds a float64 lattice.
+      Not supported when compensated.
+
+    Discount factors are close to one for short periods, so rounding
+    them to a reduced precision dtype loses most of the discount.
+    Instead a node is discounted by subtracting value * (1 - discount),
+    which keeps the full precision of the rate.
+
+    Returns the value lattice as a list of numpy arrays, one per column.
+    See lattice_error_bound for the accuracy of the result.
+
+    >>> [c.tolist() for c in roll_back([2.0, 1.0, 0.0], 0.5, 0.5)]
+    [[0.25], [0.75, 0.25], [2.0, 1.0, 0.0]]
+    """
+    assert decrement is None or not compensated, "Compensated discounting needs discount, not decrement!"
+    values = numpy.asarray(terminal_values, dtype=dtype)
+    periods = len(values) - 1
+    if adjust is not None:
+        values = numpy.asarray(adjust(periods, values), dtype=dtype)
+    up_high, up_low = __split_float(up_probability, dtype)
+    down_high, down_low = __split_float(1.0 - float(up_probability), dtype)
+    splitter = dtype(2 ** ((numpy.finfo(dtype).nmant + 2) // 2) + 1)
+    if compensated:
+        error = numpy.zeros_like(values)
+    return_lattice = [values] if full_lattice else None
+    for i in range(periods - 1, -1, -1):
+        if decrement is None:
+            period_discount = discount if numpy.isscalar(discount) else discount[i]
+        up_values, down_values = values[:-1], values[1:]
+        if compensated:
+            discount_high, discount_low = __split_float(period_discount, dtype)
+            up_part, up_error = __two_product(up_high, up_values, splitter)
+            down_part, down_error = __two_product(down_high, down_values, splitter)
+            expected, sum_error = __two_sum(up_part, down_part)
+            expected_error = (up_error + down_error + sum_error +
+                              up_high * error[:-1] + down_high * error[1:] +
+                              up_low * up_values + down_low * down_values)
+            values, product_error = __two_product(discount_high, expected, splitter)
+            values, error = __two_sum(values, product_error + discount_high * expected_error +
+                                      discount_low * expected)
+        else:
+            if decrement is None:
+                period_decrement = (1 - numpy.asarray(period_discount, dtype=float64)).astype(dtype)
+            else:
+                period_decrement = numpy.asarray(decrement if numpy.isscalar(decrement) else decrement[i],
+                                                 dtype=dtype)
+            expected = down_values + up_high * (up_values - down_values)
+            values = expected - expected * period_decrement
+        if exercise is not None:
+            exercise_values = numpy.asarray(exercise[i], dtype=dtype)
+            if compensated:
+                exercised = exercise_values > values + error
+                error = numpy.where(exercised, dtype(0), error)
+            else:
+                exercised = exercise_values > values
+            values = numpy.where(exercised, exercise_values, values)
+        if adjust is not None:
+            adjusted = numpy.asarray(adjust(i, values), dtype=dtype)
+            if compensated:
+                error = numpy.where(adjusted == values, error, dtype(0))
+            values = adjusted
+        if full_lattice:
+            return_lattice.insert(0, values)
+    return return_lattice if full_lattice else values
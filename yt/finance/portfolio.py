@@ -5,7 +5,8 @@ encapsulates a portfolio
 from numpy import array, matrix, multiply
 import numpy as np
 
-from lib import precision
+from yt.finance.lib import precision
+from yt.finance.var import HistoricalSimulation
 
 
 class Portfolio(object):
@@ -15,6 +16,13 @@ class Portfolio(object):
     covariance = None  # numpy matrix, covariance matrix
     distributions = None  # numpy array, distribution of assets
     risk_free_return = None  # the risk-free return, if it exists
+    iterations = 0  # number of iterations taken by the last constrained optimization
+    __rho = 0.1  # the ADMM step size, carried between solves
+    __sigma = 1e-6  # the ADMM proximal regularization
+    __solution = None  # the last (constraints, x, z, y) of minimize_variance_constrained
+    __eigen = None  # the (covariance, eigenvalues, eigenvectors) last decomposed
+    # the inputs the portfolio's results depend on, see store.pricer_state
+    state_attributes = ('assets', 'distributions', 'covariance', 'risk_free_return')
 
     def __init__(self, assets, distributions, covariance, risk_free_return=None):
         self.assets = array(assets)
@@ -31,7 +39,7 @@ class Portfolio(object):
         >>> p.mean_return(precision=2)
         0.05
         """
-        return self.assets.dot(self.distributions)
+        return float(self.assets.dot(self.distributions))
 
     @precision
     def volatility(self):
@@ -44,7 +52,7 @@ class Portfolio(object):
         """
         distributions_matrix = matrix(self.distributions)
         distributions_matrix = distributions_matrix * self.covariance * distributions_matrix.transpose()
-        return np.sqrt(distributions_matrix.sum())
+        return float(np.sqrt(distributions_matrix.sum()))
 
     @precision
     def minimize_variance(self, desired_return):
@@ -68,13 +76,189 @@ class Portfolio(object):
         solutions[self.asset_count] = desired_return
         return [x.item(0) for x in (matrix(lagrange_equations).I * solutions)[:self.asset_count]]
 
+    @precision
+    def value_at_risk(self, returns, confidence=0.99, block_size=4096):
+        """
+        Return the historical value at risk of the portfolio, over a
+        matrix of returns (or the path of a .npy file of one) with a row
+        per day and a column per asset. See var.HistoricalSimulation.
+
+        >>> p.value_at_risk([[0.01, 0.02, -0.03], [-0.06, 0.0, 0.03]], confidence=0.5, precision=2)
+        0.01
+        """
+        return HistoricalSimulation(returns, block_size).value_at_risk(self, confidence)
+
+    @precision
+    def expected_shortfall(self, returns, confidence=0.99, block_size=4096):
+        """
+        Return the historical expected shortfall (CVaR) of the
+        portfolio. See value_at_risk.
+        """
+        return HistoricalSimulation(returns, block_size).expected_shortfall(self, confidence)
+
+    @precision
+    def minimize_variance_constrained(self, desired_return=None, lower=0, upper=None,
+                                      groups=None, turnover=None, previous=None,
+                                      tolerance=1e-7, max_iterations=10000):
+        """
+        Optimize the distribution of the assets provided, under
+        constraints. Unlike minimize_variance, by default no asset may be
+        held short.
+
+        * desired_return: the least mean return allowed, if any
+        * lower, upper: the bounds on the distribution of each asset,
+          either a single value or one per asset. upper defaults to none.
+        * groups: a list of (asset indices, lower, upper), bounding the
+          total distribution of each group of assets
+        * turnover: the most sum(abs(distribution - previous)) allowed,
+          if any
+        * previous: the distribution turnover is measured from,
+          defaulting to distributions
+
+        The quadratic program is solved with ADMM. The eigendecomposition
+        of the covariance is computed once, and reused by every solve.
+        Each solve starts from the previous solution, so a rebalance
+        with slightly changed inputs converges in a few iterations. If
+        the residuals are still above tolerance after max_iterations,
+        which is how infeasible constraints show, ValueError is raised.
+
+        >>> q = Portfolio([0.1, 0.06, 0.02], [0, 0, 0], [[0.04, 0, 0], [0, 0.01, 0], [0, 0, 0.0025]])
+        >>> q.minimize_variance(0.08, precision=3)
+        [0.379, 0.742, -0.121]
+        >>> q.minimize_variance_constrained(0.08, precision=3)
+        [0.5, 0.5, 0.0]
+        """
+        n = self.asset_count
+        lower = np.broadcast_to(np.asarray(lower, dtype=float), (n,))
+        upper = np.broadcast_to(np.asarray(np.inf if upper is None else upper, dtype=float), (n,))
+        if previous is None:
+            previous = self.distributions
+        previous = np.asarray(previous, dtype=float)
+        # linear constraints: the budget, the desired return, and each group
+        rows, row_lower, row_upper = [np.ones(n)], [1.0], [1.0]
+        if desired_return is not None:
+            rows.append(self.assets.astype(float))
+            row_lower.append(desired_return)
+            row_upper.append(np.inf)
+        for indices, group_lower, group_upper in (groups or []):
+            row = np.zeros(n)
+            row[list(indices)] = 1
+            rows.append(row)
+            row_lower.append(group_lower)
+            row_upper.append(group_upper)
+        constraints = np.array(rows)
+        row_lower, row_upper = np.array(row_lower), np.array(row_upper)
+
+        def project(v):
+            """ project onto the bounds, the turnover limit and the rows """
+            weights = np.clip(v[:n], lower, upper)
+            if turnover is not None and np.abs(weights - previous).sum() > turnover:
+                weights = self.__project_turnover(v[:n] - previous, lower - previous,
+                                                  upper - previous, turnover) + previous
+            return np.concatenate([weights, np.clip(v[n:], row_lower, row_upper)])
+
+        x, z, y = self.__warm_start(constraints, previous)
+        rho = self.__rho
+        solve = self.__kkt_solver(constraints, rho)
+        for iteration in range(1, max_iterations + 1):
+            # x = argmin x'Sx + sigma / 2 |x - x_k|^2 + rho / 2 |Ax - z + y / rho|^2
+            x = solve(self.__sigma * x + self.__transpose_product(constraints, rho * z - y))
+            ax = np.concatenate([x, constraints.dot(x)])
+            z_previous = z
+            z = project(ax + y / rho)
+            y = y + rho * (ax - z)
+            primal_residual = np.abs(ax - z).max()
+            dual_residual = np.abs(rho * self.__transpose_product(constraints, z - z_previous)).max()
+            scale = max(1.0, np.abs(ax).max())
+            if primal_residual <= tolerance * scale and dual_residual <= tolerance * scale:
+                self.iterations = iteration
+                break
+            if iteration % 50 == 0:
+                # rebalance rho between the residuals, as OSQP does
+                ratio = np.sqrt(primal_residual / max(dual_residual, 1e-30))
+                if ratio > 5 or ratio < 0.2:
+                    rho = float(np.clip(rho * ratio, 1e-6, 1e6))
+                    solve = self.__kkt_solver(constraints, rho)
+        else:
+            # an infeasible problem never converges, and is no warm start
+            self.iterations = max_iterations
+            self.__solution = None
+            raise ValueError("The optimization did not converge in %s iterations, "
+                             "the constraints may be infeasible!" % max_iterations)
+        self.__rho = rho
+        self.__solution = (constraints, x, z, y)
+        return z[:n].tolist()
+
+    def __warm_start(self, constraints, previous):
+        """
+        Returns the last solution if it is for the same constraints,
+        otherwise starts from the previous distribution.
+        """
+        if self.__solution is not None and \
+                self.__solution[0].shape == constraints.shape and \
+                np.array_equal(self.__solution[0], constraints):
+            return self.__solution[1:]
+        return previous, np.concatenate([previous, constraints.dot(previous)]), \
+            np.zeros(self.asset_count + len(constraints))
+
+    def __kkt_solver(self, constraints, rho):
+        """
+        Returns a method solving (2S + (sigma + rho)I + rho C'C) x = r.
+        The covariance S is diagonalized once, and the low rank C'C term
+        is applied with the Woodbury identity, so a new rho or new
+        constraints only cost O(n^2 m) for m constraints.
+        """
+        covariance = np.asarray(self.covariance, dtype=float)
+        if self.__eigen is None or not np.array_equal(self.__eigen[0], covariance):
+            self.__eigen = (covariance,) + tuple(np.linalg.eigh(covariance))
+        covariance, values, vectors = self.__eigen
+        inverse_diagonal = 1 / (2 * np.maximum(values, 0) + self.__sigma + rho)
+
+        def solve_diagonal(r):
+            return vectors.dot(inverse_diagonal * vectors.T.dot(r))
+
+        projected = np.array([solve_diagonal(row) for row in constraints]).T
+        small = np.linalg.inv(np.eye(len(constraints)) / rho + constraints.dot(projected))
+
+        def solve(r):
+            base = solve_diagonal(r)
+            return base - projected.dot(small.dot(constraints.dot(base)))
+        return solve
+
+    @staticmethod
+    def __transpose_product(constraints, v):
+        """
+        Returns A'v for A = [I; constraints], without building A.
+        """
+        n = constraints.shape[1]
+        return v[:n] + constraints.T.dot(v[n:])
+
+    @staticmethod
+    def __project_turnover(v, lower, upper, turnover):
+        """
+        Project v onto {x: lower <= x <= upper, sum(abs(x)) <= turnover},
+        by bisecting on the soft threshold of v.
+        """
+        low, high = 0.0, np.abs(v).max()
+        for i in range(100):
+            threshold = (low + high) / 2
+            x = np.clip(np.sign(v) * np.maximum(np.abs(v) - threshold, 0), lower, upper)
+            if np.abs(x).sum() > turnover:
+                low = threshold
+            else:
+                high = threshold
+        return np.clip(np.sign(v) * np.maximum(np.abs(v) - high, 0), lower, upper)
+
     @precision
     def optimal_sharp_ratio(self):
         """
         Calculate the optimal sharp ratio
 
-        >>> p.optimal_sharp_ratio()
-        0
+        With uncorrelated assets, it is sqrt(sum(excess_return^2 / variance)):
+
+        >>> q = Portfolio([0.1, 0.06, 0.02], [0, 0, 0], [[0.04, 0, 0], [0, 0.01, 0], [0, 0, 0.0025]], 0.01)
+        >>> q.optimal_sharp_ratio(precision=4)
+        0.7018
         """
         assert self.risk_free_return, \
             "No risk free return found! Cannot calculate sharp ration without risk free return!"
@@ -87,4 +271,4 @@ class Portfolio(object):
         distributions_matrix = matrix(sharp_optimal_portfolio)
         distributions_matrix = distributions_matrix * self.covariance * distributions_matrix.transpose()
         volatility = np.sqrt(distributions_matrix.sum())
-        return mean_excess_return / volatility
+        return float(mean_excess_return / volatility)
@@ -0,0 +1,268 @@
+"""
+service.py: an asyncio front end for pricing requests.
+
+Identical requests that are in flight at the same time are coalesced
+into one computation, and concurrent requests are collected into
+micro-batches which are handed to a backend in one call. The backend
+can price a batch with vectorized code, or spread it over a worker pool.
+
+>>> from yt.finance.binomial import Binomial
+>>> async def quote():
+...     async with PricingService(PricerBackend(Binomial())) as service:
+...         client = LocalClient(service)
+...         return await client.convert_black_sholes_params(15, 0.25, 0.02, 110, 0.3, 0.01)
+>>> [round(x, 4) for x in asyncio.run(quote())]
+[1.0003, 1.0395, 0.0002]
+"""
+import asyncio
+import copy
+from collections import namedtuple
+
+from yt.finance import lib
+
+__author__ = 'yusuke tsutsumi'
+
+# a single pricing request: the name of the pricing method, and it's arguments
+PricingRequest = namedtuple('PricingRequest', ['method', 'args', 'kwargs'])
+
+
+class PricerBackend(object):
+    """
+    A backend which prices a batch by calling the requested method of
+    pricer (e.g. a Binomial or a Portfolio) once per request.
+
+    An exception raised by one request is returned in it's place, so it
+    does not fail the rest of the batch.
+    """
+
+    def __init__(self, pricer):
+        self.pricer = pricer
+
+    def __call__(self, requests):
+        results = []
+        for request in requests:
+            try:
+                results.append(getattr(self.pricer, request.method)(*request.args,
+                                                                    **request.kwargs))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class _Pending(object):
+    """ A request waiting on a result, shared by all of it's duplicates """
+
+    def __init__(self, request, future, deadline):
+        self.request = request
+        self.future = future
+        self.deadline = deadline  # loop time after which nobody is waiting, or None
+        self.waiters = 0  # number of submitters waiting on the result
+        self.queueing = None  # the task putting the request on the queue
+        self.coalesced = False  # whether a duplicate has joined it
+
+
+class PricingService(object):
+    """
+    Coalesces and micro-batches pricing requests for a backend.
+
+    * backend: a callable taking a list of PricingRequests, and
+      returning a list with a result for each. A result which is an
+      exception is raised to the requester instead.
+    * max_batch_size: the most requests to hand to the backend at once
+    * max_wait: the longest time, in seconds, to hold the first request
+      of a batch while waiting for more
+    * max_pending: the number of distinct requests which may be queued
+      before submitters are made to wait
+    * concurrency: the number of batches which may be priced at once
+    * executor: the concurrent.futures executor to run the backend in.
+      if None, the event loop's default executor is used.
+    """
+    backend = None
+    max_batch_size = 64
+    max_wait = 0.005
+    max_pending = 1024
+    concurrency = 1
+    executor = None
+    requests = 0  # number of requests submitted
+    coalesced = 0  # number of requests answered by an identical in flight request
+    batches = 0  # number of batches handed to the backend
+
+    def __init__(self, backend, max_batch_size=64, max_wait=0.005,
+                 max_pending=1024, concurrency=1, executor=None):
+        assert max_batch_size > 0, "max_batch_size must be at least one!"
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.executor = executor
+        self._in_flight = {}
+        self._queue = None
+        self._worker = None
+        self._dispatches = set()
+
+    async def start(self):
+        """ Start collecting requests into batches """
+        assert self._worker is None, "The service has already been started!"
+        self._queue = asyncio.Queue(self.max_pending)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._worker = asyncio.ensure_future(self._collect())
+        return self
+
+    async def close(self):
+        """ Price everything already submitted, then stop """
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        if self._dispatches:
+            await asyncio.wait(list(self._dispatches))
+        self._worker = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def submit(self, method, *args, timeout=None, **kwargs):
+        """
+        Price method(*args, **kwargs) with the backend, and return the
+        result. if timeout is provided and no result arrives within
+        timeout seconds, asyncio.TimeoutError is raised.
+
+        Waits while max_pending requests are already queued, which counts
+        against the timeout. A request is queued for as long as anyone is
+        waiting on it, so one of several identical requests timing out or
+        being cancelled does not affect the rest. Each of several identical
+        requests gets it's own copy of the result, so one can modify it
+        without affecting the rest.
+        """
+        assert self._worker is not None, "The service must be started before submitting!"
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        key = (method, lib.freeze(args), lib.freeze(kwargs))
+        self.requests += 1
+        pending = self._in_flight.get(key)
+        if pending is None:
+            pending = _Pending(PricingRequest(method, args, kwargs),
+                               loop.create_future(), deadline)
+            self._in_flight[key] = pending
+            pending.future.add_done_callback(lambda f: self._in_flight.pop(key, None))
+            # queued by a task of it's own, so it outlives this submitter
+            pending.queueing = asyncio.ensure_future(self._queue.put(pending))
+        else:
+            self.coalesced += 1
+            pending.coalesced = True
+            if pending.deadline is not None:
+                pending.deadline = None if deadline is None else max(pending.deadline, deadline)
+        pending.waiters += 1
+        try:
+            # shielded, so one requester timing out does not cancel the others
+            if timeout is None:
+                result = await asyncio.shield(pending.future)
+            else:
+                result = await asyncio.wait_for(asyncio.shield(pending.future),
+                                                max(0, deadline - loop.time()))
+        finally:
+            pending.waiters -= 1
+            if not pending.waiters and not pending.queueing.done():
+                # nobody is waiting, and it never reached the queue
+                pending.queueing.cancel()
+                self._in_flight.pop(key, None)
+                pending.future.cancel()
+        # nobody can join once the result is in, so this is final
+        if pending.coalesced:
+            return copy.deepcopy(result)
+        return result
+
+    async def _collect(self):
+        """ Collect queued requests into batches, until closed """
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            pending = await self._queue.get()
+            if pending is None:
+                break
+            batch = [pending]
+            batch_deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = batch_deadline - loop.time()
+                if remaining <= 0:
+                    # out of time, but take whatever is ready
+                    if self._queue.empty():
+                        break
+                    pending = self._queue.get_nowait()
+                else:
+                    try:
+                        pending = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if pending is None:
+                    closing = True
+                    break
+                batch.append(pending)
+            # backpressure: stop taking requests while every slot is busy
+            await self._slots.acquire()
+            dispatch = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        """ Price a batch with the backend, and hand out the results """
+        loop = asyncio.get_running_loop()
+        try:
+            now = loop.time()
+            live = []
+            for pending in batch:
+                if pending.deadline is not None and pending.deadline <= now:
+                    # every requester has given up already
+                    pending.future.cancel()
+                elif not pending.future.done():
+                    live.append(pending)
+            if not live:
+                return
+            self.batches += 1
+            try:
+                results = await loop.run_in_executor(self.executor, self.backend,
+                                                     [p.request for p in live])
+                if len(results) != len(live):
+                    raise ValueError("The backend returned %s results for %s requests!" %
+                                     (len(results), len(live)))
+            except Exception as e:
+                for pending in live:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                return
+            for pending, result in zip(live, results):
+                if pending.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    pending.future.set_exception(result)
+                else:
+                    pending.future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+class LocalClient(object):
+    """
+    An in-process stand in for a remote pricing client: every method
+    called on it is submitted to service, and returns an awaitable.
+
+    >>> client = LocalClient(None)
+    >>> client.price_call.__name__
+    'price_call'
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def submit(*args, **kwargs):
+            return self.service.submit(method, *args, **kwargs)
+        submit.__name__ = method
+        return submit
@@ -0,0 +1,251 @@
+"""
+store.py: a persistent, content addressed store of pricing results.
+
+Results are keyed by a canonical hash of the pricer's name and state,
+it's inputs and the library version, and kept in a SQLite database, so
+they outlive the process which computed them. Several local processes
+may read and write the same database at once.
+
+>>> import os, tempfile
+>>> from yt.finance import interest
+>>> store = ResultStore(os.path.join(tempfile.mkdtemp(), 'results.db'))
+>>> swap = store.cached(interest.swap, 'interest.swap')
+>>> round(swap(6, [0.07, 0.073, 0.077, 0.081, 0.084, 0.088]), 3)
+0.086
+>>> len(store)
+1
+"""
+import functools
+import hashlib
+import inspect
+import pickle
+import sqlite3
+import threading
+import time
+
+import yt.finance
+from yt.finance import lib
+
+__author__ = 'yusuke tsutsumi'
+
+# the most keys to look up in a single query
+QUERY_SIZE = 500
+
+
+def pricer_state(pricer):
+    """
+    Returns the canonical state of pricer: it's class and the attributes
+    which the results of it's methods depend on as much as on their
+    arguments. These are the names in the pricer's state_attributes if
+    it declares them, which should be it's inputs rather than anything
+    derived from them, or else it's public attributes. TypeError is
+    raised if an attribute can't be frozen (see lib.freeze), in which
+    case pass the state to the store explicitly.
+
+    >>> from yt.finance.bonds import Bond
+    >>> pricer_state(Bond(100, 1, 0.5, 0.06, 1.25, 0.9)) == pricer_state(Bond(100, 1, 0.5, 0.06, 1.25, 0.9))
+    True
+    >>> pricer_state(Bond(100, 1, 0.5, 0.06, 1.25, 0.9)) == pricer_state(Bond(100, 1, 0.5, 0.07, 1.25, 0.9))
+    False
+    """
+    if isinstance(pricer, type):
+        return lib.freeze(pricer)
+    names = getattr(pricer, 'state_attributes', None)
+    if names is None:
+        names = [name for name in vars(pricer) if not name.startswith('_')]
+    state = dict((name, getattr(pricer, name)) for name in names)
+    return lib.freeze(type(pricer)), lib.freeze(state, strict=True)
+
+
+class ResultStore(object):
+    """
+    A persistent store of pricing results
+
+    * path: the path of the SQLite database
+    * ttl: the number of seconds a result is kept for, if limited
+    * max_bytes: the most bytes of results to keep, if limited. The
+      least recently used results are evicted first.
+    * version: the version results are stored for, defaulting to the
+      version of yt.finance. Results of other versions are never
+      returned.
+    """
+    path = None  # the path of the SQLite database
+    ttl = None  # seconds to keep a result for
+    max_bytes = None  # the most bytes of results to keep
+    version = None  # the version results are stored for
+
+    def __init__(self, path, ttl=None, max_bytes=None, version=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.version = version or yt.finance.__version__
+        self.__lock = threading.Lock()
+        # a busy timeout, and write ahead logging, let several processes
+        # read and write the database at once
+        self.__connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.__lock, self.__connection:
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS results '
+                '(key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)')
+            self.__connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.__connection.close()
+
+    def key(self, name, *args, **kwargs):
+        """
+        Returns the canonical hash of a call to the pricer name with
+        args and kwargs. name may be any freezable value, e.g. a tuple of
+        the pricer's name and state. TypeError is raised for inputs which
+        can't be frozen, rather than hashing their repr.
+
+        >>> store = ResultStore(':memory:', version='0.2')
+        >>> store.key('swap', 2, [0.07, 0.073]) == store.key('swap', 2, (0.07, 0.073))
+        True
+        >>> store.key('swap', 2, [0.07, 0.073]) == ResultStore(':memory:', version='0.3').key('swap', 2, [0.07, 0.073])
+        False
+        >>> store.key('swap', object())
+        Traceback (most recent call last):
+            ...
+        TypeError: Cannot freeze an object of type object!
+        """
+        canonical = repr(lib.freeze((self.version, name, args, kwargs), strict=True))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        """ Returns the result stored for key, or default """
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """
+        Returns a dict of the results stored for keys, leaving out the
+        keys without one.
+        """
+        keys = list(set(keys))
+        now = time.time()
+        results = {}
+        with self.__lock, self.__connection:
+            for start in range(0, len(keys), QUERY_SIZE):
+                chunk = keys[start:start + QUERY_SIZE]
+                query = 'SELECT key, value FROM results WHERE key IN (%s)' % ','.join('?' * len(chunk))
+                parameters = list(chunk)
+                if self.ttl is not None:
+                    query += ' AND created > ?'
+                    parameters.append(now - self.ttl)
+                for key, value in self.__connection.execute(query, parameters):
+                    results[key] = pickle.loads(value)
+            self.__connection.executemany('UPDATE results SET accessed = ? WHERE key = ?',
+                                         [(now, key) for key in results])
+        return results
+
+    def put(self, key, value):
+        """ Store value as the result for key """
+        self.put_many({key: value})
+
+    def put_many(self, results):
+        """ Store a dict of results, by key, then evict as needed """
+        now = time.time()
+        rows = []
+        for key, value in results.items():
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((key, sqlite3.Binary(value), len(value), now, now))
+        with self.__lock, self.__connection:
+            self.__connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', rows)
+            self.__evict(now)
+
+    def evict(self):
+        """
+        Remove the results older than ttl, then the least recently used
+        results until they fit in max_bytes.
+        """
+        with self.__lock, self.__connection:
+            self.__evict(time.time())
+
+    def __evict(self, now):
+        if self.ttl is not None:
+            self.__connection.execute('DELETE FROM results WHERE created <= ?', (now - self.ttl,))
+        if self.max_bytes is not None:
+            total = self.__connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total > self.max_bytes:
+                # the running total of sizes, from the most recently used
+                self.__connection.execute(
+                    'DELETE FROM results WHERE key IN ('
+                    ' SELECT key FROM (SELECT key, SUM(size) OVER '
+                    '  (ORDER BY accessed DESC, key ROWS UNBOUNDED PRECEDING) AS kept FROM results)'
+                    ' WHERE kept > ?)', (self.max_bytes,))
+
+    def cached(self, f, name=None, state=None):
+        """
+        Returns f, wrapped to look it's results up in the store first.
+        name identifies f in the store, and defaults to it's qualified
+        name.
+
+        state is the state of f's pricer which it's results depend on. if
+        None and f is a bound method, the pricer_state of the instance it
+        is bound to is used, as it is on every call.
+        """
+        name = name or getattr(f, '__qualname__', f.__name__)
+
+        @functools.wraps(f)
+        def cached_f(*args, **kwargs):
+            if state is None and inspect.ismethod(f):
+                key = self.key((name, pricer_state(f.__self__)), *args, **kwargs)
+            else:
+                key = self.key((name, state), *args, **kwargs)
+            results = self.get_many([key])
+            if key in results:
+                return results[key]
+            result = f(*args, **kwargs)
+            self.put(key, result)
+            return result
+
+        return cached_f
+
+
+class CachedBackend(object):
+    """
+    Wraps a batch backend (see service.PricingService) so each batch is
+    looked up in a ResultStore with one query, and only the misses are
+    priced and then stored with one insert. Exceptions are not stored,
+    and neither are the results of requests with arguments which can't
+    be frozen (see ResultStore.key).
+
+    * name: identifies the backend's pricer in the store, e.g. 'Binomial'
+    * state: the state of the backend's pricer which it's results depend
+      on. if None, the pricer_state of the backend's pricer attribute
+      (see service.PricerBackend) is used, as it is for every batch.
+    """
+
+    def __init__(self, backend, store, name, state=None):
+        self.backend = backend
+        self.store = store
+        self.name = name
+        self.state = state
+
+    def __call__(self, requests):
+        state = self.state
+        if state is None and getattr(self.backend, 'pricer', None) is not None:
+            state = pricer_state(self.backend.pricer)
+        keys = []
+        for r in requests:
+            try:
+                keys.append(self.store.key((self.name + '.' + r.method, state), *r.args, **r.kwargs))
+            except TypeError:
+                # arguments which can't be frozen are priced, but not stored
+                keys.append(None)
+        stored = self.store.get_many([key for key in keys if key is not None])
+        misses = [i for i, key in enumerate(keys) if key not in stored]
+        results = [stored.get(key) for key in keys]
+        if misses:
+            priced = self.backend([requests[i] for i in misses])
+            self.store.put_many(dict((keys[i], result) for i, result in zip(misses, priced)
+                                     if keys[i] is not None and not isinstance(result, Exception)))
+            for i, result in zip(misses, priced):
+                results[i] = result
+        return results
@@ -0,0 +1,92 @@
+"""
+var.py: historical simulation value at risk and expected shortfall.
+
+The P&L of each weight vector is simulated over a history of asset
+returns, a matrix with a row per day and a column per asset. Histories
+saved as .npy files are memory-mapped and read one block of days at a
+time, so memory is bounded by the block size rather than the length of
+the history.
+"""
+import math
+
+import numpy as np
+
+from yt.finance.lib import precision
+
+__author__ = 'yusuke tsutsumi'
+
+
+class HistoricalSimulation(object):
+    """
+    Value at risk and expected shortfall over a history of returns
+
+    * returns: a matrix of returns with a row per day and a column per
+      asset, or the path of one saved as a .npy file
+    * block_size: the number of days to read at once
+
+    VaR is the loss exceeded on a (1 - confidence) fraction of days: the
+    ceil((1 - confidence) * days)th largest loss. Expected shortfall
+    (CVaR) is the mean of the losses up to and including it.
+
+    >>> h = HistoricalSimulation([[0.01, 0.02], [-0.03, 0.01], [0.02, -0.04], [-0.01, 0.0]], block_size=3)
+    >>> h.value_at_risk([0.5, 0.5], confidence=0.5, precision=3)
+    0.01
+    >>> h.expected_shortfall([0.5, 0.5], confidence=0.5, precision=3)
+    0.01
+    >>> h.value_at_risk([[1, 0], [0, 1]], confidence=0.75, precision=3)
+    [0.03, 0.04]
+    """
+    returns = None  # the matrix of returns, or it's memory map
+    block_size = 4096  # number of days to read at once
+
+    def __init__(self, returns, block_size=4096):
+        if isinstance(returns, str):
+            returns = np.load(returns, mmap_mode='r')
+        else:
+            returns = np.asarray(returns)
+        assert returns.ndim == 2, "returns must have a row per day and a column per asset!"
+        self.returns = returns
+        self.block_size = block_size
+
+    @precision
+    def value_at_risk(self, weights, confidence=0.99):
+        """
+        Returns the historical VaR of weights, see risk.
+        """
+        return self.risk(weights, confidence)[0]
+
+    @precision
+    def expected_shortfall(self, weights, confidence=0.99):
+        """
+        Returns the historical expected shortfall of weights, see risk.
+        """
+        return self.risk(weights, confidence)[1]
+
+    def risk(self, weights, confidence=0.99):
+        """
+        Returns the (VaR, expected shortfall) of weights, which is
+        either a Portfolio, a single weight vector, or a matrix with a
+        weight vector per row (returning a list of each).
+
+        The P&L of every weight vector is computed one block of days at
+        a time, as a single matrix product, and only the worst days so
+        far are kept (with a partial sort) between blocks.
+        """
+        weights = getattr(weights, 'distributions', weights)
+        weights = np.asarray(weights, dtype=np.float64)
+        single = weights.ndim == 1
+        weights = np.atleast_2d(weights)
+        days, assets = self.returns.shape
+        assert weights.shape[1] == assets, "weights must have a value per asset!"
+        tail_size = max(1, int(math.ceil(round((1 - confidence) * days, 9))))
+        tail = np.empty((0, len(weights)))
+        for start in range(0, days, self.block_size):
+            block = np.asarray(self.returns[start:start + self.block_size], dtype=np.float64)
+            tail = np.concatenate([tail, block.dot(weights.T)])
+            if len(tail) > tail_size:
+                tail = np.partition(tail, tail_size - 1, axis=0)[:tail_size]
+        value_at_risk = -tail.max(axis=0)
+        expected_shortfall = -tail.mean(axis=0)
+        if single:
+            return float(value_at_risk[0]), float(expected_shortfall[0])
+        return value_at_risk.tolist(), expected_shortfall.tolist()